@@ -0,0 +1,15 @@
+"""
+Ahead-of-time compiles the inference kernel of main.py into the `diesel_infer` extension module with numba, so
+scripts that import main.py run native code from the first call without waiting for the JIT.
+
+Build it once from the project directory with:
+    python build_infer.py
+"""
+from numba.pycc import CC
+
+if __name__ == '__main__':
+    import main
+
+    cc = CC('diesel_infer')
+    cc.export('infer', 'f8(f8, f8, f8)')(main.infer.py_func)
+    cc.compile()
@@ -0,0 +1,69 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, language_level=3
+"""
+Native version of the inference kernel of main.py, specialized to its fixed schema: inputs and output on [0, 10]
+and the poor/average/good (low/medium/high) triangles (0, 0, 5), (0, 5, 10) and (5, 10, 10). With the vertices
+known, each membership reduces to a clipped line in x / 5 and the centroid to the closed form of main.centroid().
+
+Build it once from the project directory with:
+    python setup.py build_ext --inplace
+"""
+
+
+cdef inline double clip01(double x) noexcept nogil:
+    return 0. if x < 0. else (1. if x > 1. else x)
+
+
+cdef inline double max3(double a, double b, double c) noexcept nogil:
+    return (a if a > b else b) if (a if a > b else b) > c else c
+
+
+cdef void half_moments(double falling, double rising, double *area, double *moment) noexcept nogil:
+    # area and first moment over s in [0, 1] of max(min(1 - s, falling), min(s, rising)), see main.half_moments()
+    cdef double knots[6]
+    cdef double s0 = 0., f0 = falling, s1, f1, key
+    cdef int i, j
+    knots[0] = 1. - falling
+    knots[1] = 1. - rising
+    knots[2] = falling
+    knots[3] = rising
+    knots[4] = .5
+    knots[5] = 1.
+    for i in range(1, 6):
+        key = knots[i]
+        j = i - 1
+        while j >= 0 and knots[j] > key:
+            knots[j + 1] = knots[j]
+            j -= 1
+        knots[j + 1] = key
+
+    area[0] = moment[0] = 0.
+    for i in range(6):
+        s1 = knots[i]
+        f1 = max(min(1. - s1, falling), min(s1, rising))
+        area[0] += (s1 - s0) * (f0 + f1) * .5
+        moment[0] += (s1 - s0) * (f0 * (2. * s0 + s1) + f1 * (s0 + 2. * s1)) / 6.
+        s0 = s1
+        f0 = f1
+
+
+cdef double infer_nogil(double gp, double ed, double er) noexcept nogil:
+    cdef double g = gp / 5., e = ed / 5., r = er / 5.
+    cdef double left_area, left_moment, right_area, right_moment
+    # rule 3: any input poor (1 - x / 5) -> low
+    cdef double low = max3(clip01(1. - g), clip01(1. - e), clip01(1. - r))
+    # rule 2: global price average (min(x / 5, 2 - x / 5)) -> medium
+    cdef double medium = clip01(min(g, 2. - g))
+    # rule 1: any input good (x / 5 - 1) -> high
+    cdef double high = max3(clip01(g - 1.), clip01(e - 1.), clip01(r - 1.))
+
+    half_moments(low, medium, &left_area, &left_moment)
+    half_moments(medium, high, &right_area, &right_moment)
+    return 5. * (left_moment + right_area + right_moment) / (left_area + right_area)
+
+
+cpdef double infer(double gp, double ed, double er):
+    """Final price for the three crisp inputs, computed without holding the GIL."""
+    cdef double price
+    with nogil:
+        price = infer_nogil(gp, ed, er)
+    return price
@@ -45,22 +45,43 @@ Project created by:
         Kajetan Welc
         Daniel Wirzba
 """
+import os
+import sys
+
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
 
-global_price = ctrl.Antecedent(np.arange(0., 10.01, 0.01), 'global_price')  # in $
-excise_duty = ctrl.Antecedent(np.arange(0., 10.01, 0.01), 'excise_duty')  # in zl
-exchange_rate = ctrl.Antecedent(np.arange(0., 10.01, 0.01), 'exchange_rate')  # zl to $
-final_price = ctrl.Consequent(np.arange(0., 10.01, 0.01), 'final_price')
+try:
+    from numba import njit, prange
+    NUMBA = True
+except ImportError:  # numba is optional, the fast path then simply runs as plain Python
+    NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+    prange = range
+
+
+# a 0.01 resolution is all the problem needs, so single precision is plenty; linspace, unlike a float-step arange,
+# always yields exactly 1001 points ending at 10
+UNI = np.linspace(0., 10., 1001, dtype=np.float32)
+
+# the partition automf(3) builds on the [0, 10] universe, written out directly and shared by every variable
+POOR = (0., 0., 5.)
+AVERAGE = (0., 5., 10.)
+GOOD = (5., 10., 10.)
+
 
-global_price.automf(3)
-excise_duty.automf(3)
-exchange_rate.automf(3)
+def trimf_vec(x, a, b, c):
+    """Membership of every crisp value in the array x in the triangle (a, b, c)."""
+    return np.maximum(0., np.minimum((x - a) / (b - a) if b > a else 1., (c - x) / (c - b) if c > b else 1.))
 
-final_price['low'] = fuzz.trimf(final_price.universe, [0., 0., 5.])
-final_price['medium'] = fuzz.trimf(final_price.universe, [0., 5., 10.])
-final_price['high'] = fuzz.trimf(final_price.universe, [5., 10., 10.])
+
+POOR_MF = trimf_vec(UNI, *POOR)
+AVERAGE_MF = trimf_vec(UNI, *AVERAGE)
+GOOD_MF = trimf_vec(UNI, *GOOD)
 
 """
 RULES:
@@ -75,27 +96,248 @@ imprecise rules into a defined, actionable tip is a challenge. This is the
 kind of task at which fuzzy logic excels.
 """
 
-rule1 = ctrl.Rule(global_price['good'] | excise_duty['good'] | exchange_rate['good'], final_price['high'])
-rule2 = ctrl.Rule(global_price['average'], final_price['medium'])
-rule3 = ctrl.Rule(excise_duty['poor'] | global_price['poor'] | exchange_rate['poor'], final_price['low'])
 
-rule1.view()
+def build_rules():
+    """
+    Rules 1-3 over freshly built skfuzzy variables, which share the membership arrays above.
+
+    skfuzzy.control pulls in networkx and matplotlib, so it is only imported here and never by the fast path.
+    """
+    from skfuzzy import control as ctrl
+
+    global_price = ctrl.Antecedent(UNI, 'global_price')  # in $
+    excise_duty = ctrl.Antecedent(UNI, 'excise_duty')  # in zl
+    exchange_rate = ctrl.Antecedent(UNI, 'exchange_rate')  # zl to $
+    final_price = ctrl.Consequent(UNI, 'final_price')
+
+    for antecedent in (global_price, excise_duty, exchange_rate):
+        antecedent['poor'] = POOR_MF
+        antecedent['average'] = AVERAGE_MF
+        antecedent['good'] = GOOD_MF
+
+    # the consequent uses the same triangles on the same universe, so it shares the arrays as well
+    final_price['low'] = POOR_MF
+    final_price['medium'] = AVERAGE_MF
+    final_price['high'] = GOOD_MF
+
+    rule1 = ctrl.Rule(global_price['good'] | excise_duty['good'] | exchange_rate['good'], final_price['high'])
+    rule2 = ctrl.Rule(global_price['average'], final_price['medium'])
+    rule3 = ctrl.Rule(excise_duty['poor'] | global_price['poor'] | exchange_rate['poor'], final_price['low'])
+    return [rule1, rule2, rule3]
 
-oil_purchase_ctrl = ctrl.ControlSystem([rule1, rule2, rule3])
 
-oil_purchase = ctrl.ControlSystemSimulation(oil_purchase_ctrl)
+def build_controller():
+    """Simulation of the skfuzzy control system over rules 1-3."""
+    from skfuzzy import control as ctrl
+
+    return ctrl.ControlSystemSimulation(ctrl.ControlSystem(build_rules()))
+
 
 """
-CURRENT AVERAGE PRICE OF DIESEL AROUND THE WORLD: 1.30$
-CURRENT EXCISE RATE FOR CAR PETROL IS 1529 PLN PER 1000 LITERS, WHICH IS: 1.529zl PER LITER
-CURRENT EXCHANGE RATE IS 4,21zl to 1$
+FAST PATH:
+The inputs are single crisp values and every membership function is a triangle, so the antecedents can be fuzzified
+analytically at the crisp value instead of interpolating over their dense universes. The consequent triangles split
+the output universe into two halves, [0, 5] with the falling "low" and rising "medium" edges and [5, 10] with the
+falling "medium" and rising "high" edges, so the clipped and aggregated output is piecewise linear with known kinks
+and its centroid has a closed form. No dense universe is touched at runtime.
 """
 
-oil_purchase.input['global_price'] = 1.30
-oil_purchase.input['excise_duty'] = 1.59
-oil_purchase.input['exchange_rate'] = 4.21
 
-oil_purchase.compute()
+@njit(cache=True)
+def trimf_scalar(x, a, b, c):
+    """Membership of the crisp value x in the triangle (a, b, c)."""
+    return max(0., min((x - a) / (b - a) if b > a else 1., (c - x) / (c - b) if c > b else 1.))
+
+
+@njit(cache=True)
+def _sort6(k0, k1, k2, k3, k4, k5):
+    """The six values in ascending order, through a 12-comparator sorting network that needs no array."""
+    k0, k5 = min(k0, k5), max(k0, k5)
+    k1, k3 = min(k1, k3), max(k1, k3)
+    k2, k4 = min(k2, k4), max(k2, k4)
+    k1, k2 = min(k1, k2), max(k1, k2)
+    k3, k4 = min(k3, k4), max(k3, k4)
+    k0, k3 = min(k0, k3), max(k0, k3)
+    k2, k5 = min(k2, k5), max(k2, k5)
+    k0, k1 = min(k0, k1), max(k0, k1)
+    k2, k3 = min(k2, k3), max(k2, k3)
+    k4, k5 = min(k4, k5), max(k4, k5)
+    k1, k2 = min(k1, k2), max(k1, k2)
+    k3, k4 = min(k3, k4), max(k3, k4)
+    return k0, k1, k2, k3, k4, k5
+
+
+@njit(cache=True)
+def half_moments(falling, rising):
+    """
+    Area and first moment over s in [0, 1] of max(min(1 - s, falling), min(s, rising)), the aggregated output on
+    one half of the universe measured in units of that half.
+    """
+    # the output is linear between the intersections of the lines 1 - s, s, falling and rising
+    knots = _sort6(1. - falling, 1. - rising, falling, rising, .5, 1.)
+    area = moment = 0.
+    s0, f0 = 0., max(min(1., falling), 0.)
+    for s1 in knots:
+        f1 = max(min(1. - s1, falling), min(s1, rising))
+        area += (s1 - s0) * (f0 + f1) / 2.
+        moment += (s1 - s0) * (f0 * (2. * s0 + s1) + f1 * (s0 + 2. * s1)) / 6.
+        s0, f0 = s1, f1
+    return area, moment
+
+
+@njit(cache=True)
+def centroid(low, medium, high):
+    """Centroid of the low, medium and high consequent triangles clipped at the given rule activations."""
+    left_area, left_moment = half_moments(low, medium)
+    right_area, right_moment = half_moments(medium, high)
+    # z = 5 * s on the left half and z = 5 + 5 * s on the right one
+    return 5. * (left_moment + right_area + right_moment) / (left_area + right_area)
+
+
+@njit(cache=True)
+def rule_activations(gp, ed, er):
+    """Activations of the low, medium and high consequent terms for the three crisp inputs."""
+    low = max(trimf_scalar(gp, *POOR), trimf_scalar(ed, *POOR), trimf_scalar(er, *POOR))  # rule 3: any input poor
+    medium = trimf_scalar(gp, *AVERAGE)  # rule 2: global price average
+    high = max(trimf_scalar(gp, *GOOD), trimf_scalar(ed, *GOOD), trimf_scalar(er, *GOOD))  # rule 1: any input good
+    return low, medium, high
+
+
+@njit(cache=True, fastmath=True)
+def infer(gp, ed, er):
+    """Fuzzify the crisp inputs, evaluate rules 1-3 and return the centroid of the aggregated output."""
+    return centroid(*rule_activations(gp, ed, er))
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def _infer_batch(gps, eds, ers, out):
+    """
+    infer() over 1-D input arrays of equal length, written into out. The points are split across threads and the GIL
+    is released, so it also scales when called from several Python threads. Used by compute_batch() under numba.
+    """
+    n = gps.shape[0]
+    if eds.shape[0] != n or ers.shape[0] != n or out.shape[0] != n:
+        raise ValueError('input and output arrays must have the same length')
+    for i in prange(n):
+        out[i] = infer(gps[i], eds[i], ers[i])
+    return out
+
+
+# prebuilt native kernels run from the first call without JIT compilation: the Cython one built by setup.py, then the
+# numba AOT one built by build_infer.py, falling back to the JIT-compiled infer()
+try:
+    from diesel_kernel import infer as native_infer
+except ImportError:
+    try:
+        from diesel_infer import infer as native_infer
+    except ImportError:
+        native_infer = infer
+
+
+def compute_diesel(global_price_value, excise_duty_value, exchange_rate_value):
+    """
+    Evaluate rules 1-3 for the given crisp inputs and return the defuzzified final price.
+
+    This is the same controller as the skfuzzy control system, without its state dictionaries and rule graph.
+    """
+    return float(native_infer(float(global_price_value), float(excise_duty_value), float(exchange_rate_value)))
+
+
+def half_moments_batch(falling, rising):
+    """half_moments() for arrays of activations, integrating every point at once along a trailing knot axis."""
+    knots = np.sort(np.stack([np.zeros_like(falling), 1. - falling, 1. - rising, falling, rising,
+                              np.full_like(falling, .5), np.ones_like(falling)], axis=-1), axis=-1)
+    values = np.maximum(np.minimum(1. - knots, falling[..., None]), np.minimum(knots, rising[..., None]))
+    s0, s1, f0, f1 = knots[..., :-1], knots[..., 1:], values[..., :-1], values[..., 1:]
+    area = ((s1 - s0) * (f0 + f1) / 2.).sum(axis=-1)
+    moment = ((s1 - s0) * (f0 * (2. * s0 + s1) + f1 * (s0 + 2. * s1)) / 6.).sum(axis=-1)
+    return area, moment
+
+
+def compute_batch(global_price_values, excise_duty_values, exchange_rate_values):
+    """
+    compute_diesel() over arrays of inputs (broadcast against each other), returning an array of final prices.
+
+    With numba the points go through the parallel _infer_batch() kernel, otherwise through the NumPy expressions below.
+    """
+    crisp = np.broadcast_arrays(global_price_values, excise_duty_values, exchange_rate_values)
+    if NUMBA:
+        gps, eds, ers = (np.ascontiguousarray(values, dtype=np.float64).ravel() for values in crisp)
+        return _infer_batch(gps, eds, ers, np.empty_like(gps)).reshape(crisp[0].shape)
+
+    crisp = np.stack(crisp, axis=-1).astype(np.float64)
+    # a[..., variable, term]
+    a = np.stack([trimf_vec(crisp, *POOR), trimf_vec(crisp, *AVERAGE), trimf_vec(crisp, *GOOD)], axis=-1)
+    low, medium, high = a[..., 0].max(axis=-1), a[..., 0, 1], a[..., 2].max(axis=-1)
+
+    left_area, left_moment = half_moments_batch(low, medium)
+    right_area, right_moment = half_moments_batch(medium, high)
+    return 5. * (left_moment + right_area + right_moment) / (left_area + right_area)
+
+
+# compile (or load from the on-disk cache) once at import, not on the first query
+compute_diesel(0., 0., 0.)
+
+
+# figure, activation fill and crisp value line of view_final_price(), created by its first call
+_price_view = {}
+
+
+def view_final_price(global_price_value, excise_duty_value, exchange_rate_value):
+    """
+    Plot the final price terms, the aggregated output and the crisp final price for the given inputs.
+
+    The figure and the static term lines are drawn once; later calls only move the activation fill and the crisp value
+    line, which keeps repeated calls (e.g. while tuning the inputs) cheap. Returns the Figure and Axes.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PolyCollection
+
+    low, medium, high = rule_activations(float(global_price_value), float(excise_duty_value),
+                                         float(exchange_rate_value))
+    aggregated = np.maximum(np.minimum(POOR_MF, low),
+                            np.maximum(np.minimum(AVERAGE_MF, medium), np.minimum(GOOD_MF, high)))
+    outline = np.concatenate([np.column_stack([UNI, aggregated]), [[UNI[-1], 0.], [UNI[0], 0.]]])
+    crisp_value = centroid(low, medium, high)
+    # as in skfuzzy's view, the crisp value is drawn up to the output, or full height if that is too small to see
+    height = np.interp(crisp_value, UNI, aggregated)
+    height = height if height >= .1 else 1.
+
+    if not _price_view or not plt.fignum_exists(_price_view['fig'].number):
+        fig, ax = plt.subplots()
+        for label, mf in (('low', POOR_MF), ('medium', AVERAGE_MF), ('high', GOOD_MF)):
+            ax.plot(UNI, mf, linewidth=1.5, label=label)
+        fill = ax.add_collection(PolyCollection([outline], facecolor='tab:gray', alpha=.4))
+        crisp, = ax.plot([crisp_value] * 2, [0, height], color='k', lw=3, label='crisp value')
+        ax.set_xlim(UNI[0], UNI[-1])
+        ax.set_ylim(0, 1.05)
+        ax.set_xlabel('final_price')
+        ax.set_ylabel('Membership')
+        ax.legend()
+        _price_view.update(fig=fig, ax=ax, fill=fill, crisp=crisp)
+    else:
+        _price_view['fill'].set_verts([outline])
+        _price_view['crisp'].set_data([crisp_value] * 2, [0, height])
+        _price_view['fig'].canvas.draw_idle()
+
+    return _price_view['fig'], _price_view['ax']
+
+
+if __name__ == '__main__':
+    """
+    CURRENT AVERAGE PRICE OF DIESEL AROUND THE WORLD: 1.30$
+    CURRENT EXCISE RATE FOR CAR PETROL IS 1529 PLN PER 1000 LITERS, WHICH IS: 1.529zl PER LITER
+    CURRENT EXCHANGE RATE IS 4,21zl to 1$
+    """
+    print(compute_diesel(1.30, 1.59, 4.21))
+
+    # plotting pulls in matplotlib, so it only happens when asked for with --plot or NAI2_PLOT=1
+    if '--plot' in sys.argv or os.environ.get('NAI2_PLOT'):
+        import matplotlib.pyplot as plt
 
-print(oil_purchase.output['final_price'])
-final_price.view(sim=oil_purchase)
+        view_final_price(1.30, 1.59, 4.21)
+        try:
+            build_rules()[0].view()
+        except AttributeError:  # scikit-fuzzy 0.5.0 cannot draw rule graphs; leave out its half-built figure
+            plt.close()
+        plt.show()
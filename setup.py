@@ -0,0 +1,12 @@
+"""
+Builds the optional Cython kernel used by main.py:
+    python setup.py build_ext --inplace
+"""
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+setup(
+    name='nai2-diesel-kernel',
+    ext_modules=cythonize(Extension('diesel_kernel', ['diesel_kernel.pyx'],
+                                    extra_compile_args=['-O3', '-march=native', '-ffast-math'])),
+)
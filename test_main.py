@@ -0,0 +1,90 @@
+"""
+Regression checks that keep the copies of the closed-form controller (the numba kernels, the NumPy batch path and the
+optional native extensions) in agreement with each other and with the skfuzzy control system.
+"""
+import importlib
+import itertools
+
+import numpy as np
+import pytest
+
+import main
+
+GRID = [(0., 0., 0.), (10., 10., 10.), (5., 5., 5.), (1.30, 1.59, 4.21)] + \
+    list(itertools.product([0., 2.5, 5., 7.5, 10.], [0., 3.3, 6.6, 10.], [1., 4.21, 9.]))
+
+
+def simulate(global_price_value, excise_duty_value, exchange_rate_value):
+    oil_purchase = main.build_controller()
+    oil_purchase.input['global_price'] = global_price_value
+    oil_purchase.input['excise_duty'] = excise_duty_value
+    oil_purchase.input['exchange_rate'] = exchange_rate_value
+    oil_purchase.compute()
+    return oil_purchase.output['final_price']
+
+
+def test_documented_example():
+    assert round(main.compute_diesel(1.30, 1.59, 4.21), 4) == 3.5798
+
+
+@pytest.mark.parametrize('crisp', GRID)
+def test_matches_control_system(crisp):
+    assert main.compute_diesel(*crisp) == pytest.approx(simulate(*crisp), abs=1e-4)
+
+
+def test_backends_agree():
+    expected = np.array([main.compute_diesel(*crisp) for crisp in GRID])
+    gps, eds, ers = np.array(GRID).T
+
+    np.testing.assert_allclose([main.infer(*crisp) for crisp in GRID], expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(main.compute_batch(gps, eds, ers), expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(main.compute_batch(gps[:, None], eds[:, None], ers[:, None])[:, 0], expected,
+                               rtol=0, atol=1e-9)
+
+
+def test_numpy_batch_path(monkeypatch):
+    monkeypatch.setattr(main, 'NUMBA', False)
+    gps, eds, ers = np.array(GRID).T
+    expected = [main.compute_diesel(*crisp) for crisp in GRID]
+    np.testing.assert_allclose(main.compute_batch(gps, eds, ers), expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(main.compute_batch(gps[:, None], eds[:, None], ers[:, None])[:, 0], expected,
+                               rtol=0, atol=1e-9)
+
+
+def test_batch_kernel_rejects_unequal_lengths():
+    with pytest.raises(ValueError):
+        main._infer_batch(np.ones(5), np.ones(2), np.ones(2), np.empty(5))
+    with pytest.raises(ValueError):
+        main._infer_batch(np.ones(5), np.ones(5), np.ones(5), np.empty(2))
+
+
+@pytest.mark.parametrize('module', ['diesel_kernel', 'diesel_infer'])
+def test_native_kernel_agrees(module):
+    try:
+        native = importlib.import_module(module)
+    except ImportError:
+        pytest.skip(f'{module} is not built')
+    for crisp in GRID:
+        assert native.infer(*crisp) == pytest.approx(main.infer(*crisp), abs=1e-9)
+
+
+def test_view_reuses_figure(monkeypatch):
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PolyCollection
+
+    monkeypatch.setattr(main, '_price_view', {})
+    fig, ax = main.view_final_price(1.30, 1.59, 4.21)
+    first = ax.collections[0].get_paths()[0].vertices.copy()
+
+    again, ax = main.view_final_price(8., 7., 9.)
+    fills = [artist for artist in ax.collections if isinstance(artist, PolyCollection)]
+    assert again is fig
+    assert len(fills) == 1
+    assert not np.array_equal(fills[0].get_paths()[0].vertices, first)
+
+    plt.close(fig)
+    rebuilt, _ = main.view_final_price(8., 7., 9.)
+    assert rebuilt is not fig
+    plt.close(rebuilt)